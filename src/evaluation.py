@@ -6,7 +6,7 @@ import multiprocessing as mp
 from func_timeout import func_timeout, FunctionTimedOut
 
 def load_json(dir):
-    with open(dir, 'r') as j:
+    with open(dir, 'r', encoding='utf-8') as j:
         contents = json.loads(j.read())
     return contents
 
@@ -52,7 +52,7 @@ def package_sqls(sql_path, db_root_path, mode='gpt', data_mode='dev'):
     clean_sqls = []
     db_path_list = []
     if mode == 'gpt':
-        sql_data = json.load(open(sql_path + 'predict_' + data_mode + '.json', 'r'))
+        sql_data = json.load(open(sql_path + 'predict_' + data_mode + '.json', 'r', encoding='utf-8'))
         for idx, sql_str in sql_data.items():
             if type(sql_str) == str:
                 sql, db_name = sql_str.split('\t----- bird -----\t')
@@ -1,28 +1,66 @@
 #!/usr/bin/env python3
 import argparse
-import csv
+import asyncio
+import contextlib
+import functools
+import hashlib
 import json
 import os
+import queue
+import re
 import sqlite3
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Tuple
-from tqdm import tqdm
+import pandas as pd
+from tqdm.asyncio import tqdm as async_tqdm
 import backoff
-from openai import OpenAI, APIError, RateLimitError, APITimeoutError
+import diskcache
+import ijson
+from aiolimiter import AsyncLimiter
+from openai import OpenAI, AsyncOpenAI, APIError, RateLimitError, APITimeoutError
 
+try:
+    import orjson
+except ImportError:  # optional speedup; fall back to the stdlib json module
+    orjson = None
 
 
-def init_client(api_key: str = None):
+
+def resolve_api_key(api_key: str = None) -> str:
     if api_key:
         os.environ["OPENAI_API_KEY"] = api_key
-        return OpenAI(api_key=api_key)
-    else:
-        key = os.getenv("OPENAI_API_KEY")
-        if not key:
-            raise ValueError("❌ No API key provided. Use --api_key or set OPENAI_API_KEY.")
-        return OpenAI(api_key=key)
+        return api_key
+    key = os.getenv("OPENAI_API_KEY")
+    if not key:
+        raise ValueError("❌ No API key provided. Use --api_key or set OPENAI_API_KEY.")
+    return key
 
 
+@functools.lru_cache(maxsize=None)
+def init_client(api_key: str = None):
+    """Return one shared OpenAI client per api_key so its HTTP connection pool is reused."""
+    return OpenAI(api_key=resolve_api_key(api_key))
+
+
+BATCH_SYSTEM_PROMPT = "You are a Text-to-SQL expert. Output only valid SQL code."
+BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+_FENCE_RE = re.compile(r"```(?:sql)?", re.IGNORECASE)
+DEFAULT_CACHE_DIR = "./exp_result/.llm_cache"
+
+# Read-side tuning for schema introspection. journal_mode/synchronous are left
+# untouched: the BIRD databases are only read here, and switching to WAL would
+# rewrite the database file header.
+READ_PRAGMAS = (
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=30000000000",
+)
+DESCRIPTION_COLUMNS = {"original_column_name", "column_name", "column_description"}
+_CONN_CACHE: Dict[str, sqlite3.Connection] = {}
+_CONN_LOCK = threading.Lock()
+
 
 def new_directory(path):
     if not os.path.exists(path):
@@ -34,6 +72,27 @@ def quote_identifier(name: str) -> str:
     return '"' + name.replace('"', '""') + '"'
 
 
+def get_connection(db_path: str) -> sqlite3.Connection:
+    """Return a tuned, process-wide shared connection for `db_path`."""
+    with _CONN_LOCK:
+        conn = _CONN_CACHE.get(db_path)
+        if conn is None:
+            conn = sqlite3.connect(db_path, check_same_thread=False)
+            for pragma in READ_PRAGMAS:
+                conn.execute(pragma)
+            _CONN_CACHE[db_path] = conn
+    return conn
+
+
+def read_description_csv(file_path: str) -> pd.DataFrame:
+    read_kwargs = dict(usecols=lambda c: c in DESCRIPTION_COLUMNS, index_col=False, dtype=str, keep_default_na=False)
+    # utf-8-sig is strict utf-8 that also drops a leading BOM; latin-1 never fails to decode.
+    try:
+        return pd.read_csv(file_path, encoding="utf-8-sig", **read_kwargs)
+    except UnicodeDecodeError:
+        return pd.read_csv(file_path, encoding="latin-1", **read_kwargs)
+
+
 def load_column_descriptions(db_path: str) -> Dict[str, Dict[str, str]]:
     """Load column descriptions from optional CSV files under database_description."""
     db_dir = os.path.dirname(db_path)
@@ -47,104 +106,141 @@ def load_column_descriptions(db_path: str) -> Dict[str, Dict[str, str]]:
             continue
         table_name = os.path.splitext(file_name)[0].lower()
         file_path = os.path.join(description_dir, file_name)
+        try:
+            df = read_description_csv(file_path)
+        except (OSError, ValueError):
+            continue
+        if "column_description" not in df:
+            continue
+
+        column_desc = df["column_description"].str.strip()
         table_desc: Dict[str, str] = {}
-        decoded = False
-        for encoding in ("utf-8-sig", "utf-8", "latin-1"):
-            try:
-                with open(file_path, "r", encoding=encoding, newline="") as csv_file:
-                    reader = csv.DictReader(csv_file)
-                    for row in reader:
-                        description = (row.get("column_description") or "").strip()
-                        col_candidates = [
-                            (row.get("original_column_name") or "").strip(),
-                            (row.get("column_name") or "").strip()
-                        ]
-                        for col_name in col_candidates:
-                            if not col_name:
-                                continue
-                            table_desc[col_name.lower()] = description
-                decoded = True
-                break
-            except UnicodeDecodeError:
+        # column_name is a fallback; original_column_name wins on conflicts.
+        for key in ("column_name", "original_column_name"):
+            if key not in df:
                 continue
-            except (OSError, csv.Error):
-                table_desc = {}
-                break
-        if decoded and table_desc:
+            col_names = df[key].str.strip().str.lower()
+            table_desc.update((name, desc) for name, desc in zip(col_names, column_desc) if name)
+        if table_desc:
             descriptions[table_name] = table_desc
     return descriptions
 
 
-def fetch_column_examples(conn: sqlite3.Connection, table_name: str, column_name: str, limit: int = 3) -> List[str]:
-    """Fetch up to `limit` distinct non-null example values for a column."""
-    cursor = conn.cursor()
+def fetch_table_examples(
+    conn: sqlite3.Connection,
+    table_name: str,
+    column_names: List[str],
+    limit: int = 3,
+    scan_rows: int = 200,
+) -> Dict[str, List[str]]:
+    """Fetch up to `limit` distinct non-null example values per column with one query.
+
+    Examples are taken from at most the first `scan_rows` rows of the table
+    rather than a full `SELECT DISTINCT` scan of every column, and reading
+    stops as soon as every column has `limit` examples.
+    """
+    examples: Dict[str, List[str]] = {name: [] for name in column_names}
+    if limit <= 0 or not column_names:
+        return examples
+
     tbl = quote_identifier(table_name)
-    col = quote_identifier(column_name)
+    cols = ", ".join(quote_identifier(name) for name in column_names)
+    unfilled = len(column_names)
     try:
-        cursor.execute(f"SELECT DISTINCT {col} FROM {tbl} WHERE {col} IS NOT NULL LIMIT ?", (limit,))
-        values = cursor.fetchall()
+        for row in conn.execute(f"SELECT {cols} FROM {tbl} LIMIT ?", (scan_rows,)):
+            for name, value in zip(column_names, row):
+                if value is None:
+                    continue
+                values = examples[name]
+                if len(values) < limit:
+                    value = str(value)
+                    if value not in values:
+                        values.append(value)
+                        if len(values) == limit:
+                            unfilled -= 1
+            if not unfilled:
+                break
     except sqlite3.Error:
-        return []
-
-    examples = []
-    for (value,) in values:
-        if value is None:
-            continue
-        examples.append(str(value))
+        pass
     return examples
 
 
-def get_foreign_keys(conn: sqlite3.Connection, table_name: str) -> Dict[str, Tuple[str, str]]:
-    """Return mapping from column -> (referenced_table, referenced_column)."""
-    cursor = conn.cursor()
+TABLE_COLUMNS_SQL = """
+SELECT m.name, t.cid, t.name, t.type, t."notnull", t.dflt_value, t.pk
+FROM sqlite_master m, pragma_table_info(m.name) t
+WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%'
+ORDER BY m.name, t.cid
+"""
+FOREIGN_KEYS_SQL = """
+SELECT m.name, f."from", f."table", f."to"
+FROM sqlite_master m, pragma_foreign_key_list(m.name) f
+WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%'
+ORDER BY m.name, f.id, f.seq
+"""
+
+
+def get_schema_metadata(
+    conn: sqlite3.Connection, tables: List[str]
+) -> Tuple[Dict[str, List[tuple]], Dict[str, Dict[str, Tuple[str, str]]]]:
+    """Return per-table column info and foreign keys for every table at once.
+
+    columns: table -> [(cid, name, type, notnull, dflt_value, pk), ...]
+    foreign_keys: table -> {column: (referenced_table, referenced_column)}
+    """
     try:
-        cursor.execute(f'PRAGMA foreign_key_list({quote_identifier(table_name)})')
-        fk_info = cursor.fetchall()
+        column_rows = conn.execute(TABLE_COLUMNS_SQL).fetchall()
+        fk_rows = conn.execute(FOREIGN_KEYS_SQL).fetchall()
     except sqlite3.Error:
-        return {}
+        # A single unreadable table fails the joined query; fall back to per-table PRAGMAs.
+        column_rows, fk_rows = [], []
+        for table_name in tables:
+            quoted_table = quote_identifier(table_name)
+            try:
+                column_rows.extend((table_name,) + row for row in conn.execute(f"PRAGMA table_info({quoted_table})"))
+                # row schema: (id, seq, table, from, to, on_update, on_delete, match)
+                fk_rows.extend((table_name, row[3], row[2], row[4])
+                               for row in conn.execute(f"PRAGMA foreign_key_list({quoted_table})"))
+            except sqlite3.Error:
+                continue
 
-    fk_map: Dict[str, Tuple[str, str]] = {}
-    for row in fk_info:
-        # row schema: (id, seq, table, from, to, on_update, on_delete, match)
-        if len(row) >= 5:
-            from_col = row[3]
-            ref_table = row[2]
-            ref_column = row[4]
-            fk_map[from_col] = (ref_table, ref_column)
-    return fk_map
+    columns: Dict[str, List[tuple]] = {}
+    for row in column_rows:
+        columns.setdefault(row[0], []).append(row[1:])
+
+    foreign_keys: Dict[str, Dict[str, Tuple[str, str]]] = {}
+    for table_name, from_col, ref_table, ref_column in fk_rows:
+        foreign_keys.setdefault(table_name, {})[from_col] = (ref_table, ref_column)
+    return columns, foreign_keys
 
 
 def build_table_prompt(
     conn: sqlite3.Connection,
     table_name: str,
+    columns_info: List[tuple],
+    fk_map: Dict[str, Tuple[str, str]],
     descriptions: Dict[str, Dict[str, str]],
     sample_limit: int,
     fk_relations: List[str],
 ) -> str:
-    cursor = conn.cursor()
-    quoted_table = quote_identifier(table_name)
-    try:
-        cursor.execute(f"PRAGMA table_info({quoted_table})")
-        columns_info = cursor.fetchall()
-    except sqlite3.Error:
-        return ""
-
     if not columns_info:
         return ""
 
-    fk_map = get_foreign_keys(conn, table_name)
     table_desc_map = descriptions.get(table_name.lower(), {})
+    # SQLite identifiers are case-insensitive; match FK columns the same way as descriptions.
+    fk_map_lower = {col.lower(): ref for col, ref in fk_map.items()}
+    column_examples = fetch_table_examples(conn, table_name, [col[1] for col in columns_info], limit=sample_limit)
 
     column_lines = []
-    for idx, col in enumerate(columns_info):
+    for col in columns_info:
         # col schema: (cid, name, type, notnull, dflt_value, pk)
         col_name = col[1]
         col_type = col[2] or "UNKNOWN"
         is_pk = bool(col[5])
-        description = table_desc_map.get(col_name.lower(), "").strip()
+        col_lower = col_name.lower()
+        description = table_desc_map.get(col_lower, "").strip()
         if description:
             description = " ".join(description.split())
-        fk_info = fk_map.get(col_name)
+        fk_info = fk_map_lower.get(col_lower)
         if fk_info:
             fk_relations.append(f"{table_name}.{col_name} = {fk_info[0]}.{fk_info[1]}")
 
@@ -152,47 +248,55 @@ def build_table_prompt(
         if is_pk:
             parts.append("Primary Key")
         if description and fk_info:
-            lower_desc = description.lower()
-            maps_idx = lower_desc.find("maps to")
+            maps_idx = description.lower().find("maps to")
             if maps_idx != -1:
                 description = description[:maps_idx].rstrip(", ")
         if description:
             parts.append(description)
 
         parts_text = ", ".join(parts)
-        examples = fetch_column_examples(conn, table_name, col_name, limit=sample_limit)
+        examples = column_examples.get(col_name)
         examples_str = ", ".join(examples[:sample_limit]) if examples else ""
-        line = f"  ({parts_text}"
+        line_parts = [f"  ({parts_text}"]
         if fk_info:
-            line += f"\n   Maps to {fk_info[0]}({fk_info[1]})"
+            line_parts.append(f"\n   Maps to {fk_info[0]}({fk_info[1]})")
         if examples_str:
-            line += f", Examples: [{examples_str}]"
-        line += ")"
-        if idx < len(columns_info) - 1:
-            line += ","
-        column_lines.append(line)
+            line_parts.append(f", Examples: [{examples_str}]")
+        line_parts.append(")")
+        column_lines.append("".join(line_parts))
 
-    table_block = f"# Table: {table_name}\n[\n" + "\n\n".join(column_lines) + "\n]"
-    return table_block
+    return "".join([f"# Table: {table_name}\n[\n", ",\n\n".join(column_lines), "\n]"])
 
 
+@functools.lru_cache(maxsize=None)
 def generate_schema_prompt(db_path: str, sample_limit: int = 3):
-    """Build an m-schema style prompt with column metadata, examples, and foreign keys."""
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
-    tables = sorted(row[0] for row in cursor.fetchall())
+    """Build an m-schema style prompt with column metadata, examples, and foreign keys.
 
+    Results are cached per (db_path, sample_limit): every question on the same
+    database shares one schema prompt instead of re-introspecting SQLite.
+    """
+    conn = get_connection(db_path)
     descriptions = load_column_descriptions(db_path)
     schema_sections = []
     fk_relations: List[str] = []
 
-    for table_name in tables:
-        table_prompt = build_table_prompt(conn, table_name, descriptions, sample_limit, fk_relations)
-        if table_prompt:
-            schema_sections.append(table_prompt)
-
-    conn.close()
+    # One read transaction for the whole walk so the shared lock is taken once.
+    conn.execute("BEGIN")
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
+        tables = sorted(row[0] for row in cursor.fetchall())
+        columns, foreign_keys = get_schema_metadata(conn, tables)
+
+        for table_name in tables:
+            table_prompt = build_table_prompt(
+                conn, table_name, columns.get(table_name, []), foreign_keys.get(table_name, {}),
+                descriptions, sample_limit, fk_relations
+            )
+            if table_prompt:
+                schema_sections.append(table_prompt)
+    finally:
+        conn.commit()
 
     if fk_relations:
         unique_fk = sorted(set(fk_relations))
@@ -202,15 +306,26 @@ def generate_schema_prompt(db_path: str, sample_limit: int = 3):
     return "\n\n".join(schema_sections)
 
 
+def warm_schema_cache(db_path_list, max_workers=8):
+    """Build the schema prompt of every distinct database in parallel.
+
+    SQLite releases the GIL while it runs queries, so the one-time
+    introspection of each database overlaps across threads.
+    """
+    unique_dbs = list(dict.fromkeys(db_path_list))
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        return dict(zip(unique_dbs, ex.map(generate_schema_prompt, unique_dbs)))
+
+
 def generate_comment_prompt(question, knowledge=None):
     pattern_no_kg = "-- Using valid SQLite, answer the following questions for the tables provided above."
     pattern_kg = "-- Using valid SQLite and understanding External Knowledge, answer the following questions for the tables provided above. Return only the SQL query. Do not provide any explanation."
     question_prompt = f"-- {question}"
     if knowledge:
         knowledge_prompt = f"-- External Knowledge: {knowledge}"
-        return knowledge_prompt + '\n' + pattern_kg + '\n' + question_prompt
+        return '\n'.join([knowledge_prompt, pattern_kg, question_prompt])
     else:
-        return pattern_no_kg + '\n' + question_prompt
+        return '\n'.join([pattern_no_kg, question_prompt])
 
 
 # def cot_wizard():
@@ -220,75 +335,344 @@ def generate_comment_prompt(question, knowledge=None):
 def generate_combined_prompts_one(db_path, question, knowledge=None):
     schema_prompt = generate_schema_prompt(db_path)
     comment_prompt = generate_comment_prompt(question, knowledge)
-    combined_prompts = schema_prompt + '\n\n' + comment_prompt + '\nSELECT '
-    return combined_prompts
+    return '\n\n'.join([schema_prompt, comment_prompt]) + '\nSELECT '
 
 
 
 def quota_giveup(e):
-    return isinstance(e, RateLimitError)
+    """Stop retrying only when the account is out of quota; other 429s (TPM/RPM) are transient."""
+    return isinstance(e, RateLimitError) and getattr(e, "code", None) == "insufficient_quota"
 
 
 @backoff.on_exception(
-    backoff.constant,
+    backoff.expo,
     (APIError, RateLimitError, APITimeoutError, Exception),
     giveup=quota_giveup,
-    interval=15,
-    max_tries=3
+    # ~30s of exponential waits, enough to ride out a per-minute token limit window
+    max_tries=6
 )
-def connect_gpt(client, engine, prompt, max_tokens=256, temperature=0, stop=None):
-    """Call GPT and return text output."""
-    result = client.completions.create(
-        model=engine,
-        prompt=prompt,
-        max_tokens=max_tokens,
-        temperature=temperature,
-        stop=stop or [";", "#", "--"]
-    )
+async def connect_gpt_async(client, engine, prompt, max_tokens=256, temperature=0, stop=None, limiter=None):
+    """Call GPT through an AsyncOpenAI client and return text output.
+
+    `limiter` (an AsyncLimiter) is acquired on every attempt, so backoff
+    retries are rate limited like the first request.
+    """
+    async with limiter or contextlib.nullcontext():
+        result = await client.completions.create(
+            model=engine,
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop=stop or [";", "#", "--"]
+        )
     return result.choices[0].text
 
 
 
-def collect_response_from_gpt(db_path_list, question_list, api_key, engine, knowledge_list=None, log_dir="./exp_result/log/"):
-    client = init_client(api_key)
+def prompt_hash(endpoint, engine, prompt):
+    """Content key for the response cache; temperature-0 prompts map to one output."""
+    key = "\n".join([endpoint, engine, prompt])
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def format_response(sql_text, db_id):
+    """Prefix the completion with SELECT and append the db_id tag expected by the evaluator."""
+    sql = 'SELECT' + sql_text if not sql_text.strip().upper().startswith('SELECT') else sql_text
+    return sql.strip() + f"\t----- bird -----\t{db_id}"
+
+
+def dumps_json_line(record) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(record) + b"\n"
+    return json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def format_log_entry(i, db_id, question, engine, prompt, sql_text) -> bytes:
+    """One JSONL record of the prompt log."""
+    return dumps_json_line({
+        "ts": time.time(),
+        "q_idx": i,
+        "db": db_id,
+        "engine": engine,
+        "question": question,
+        "prompt": prompt,
+        "response": sql_text.strip(),
+    })
+
+
+class _LogWriter(threading.Thread):
+    """Append encoded log records from a background thread, off the request path.
+
+    Records are written in batches of up to `batch_size` and the file is
+    flushed at most once per `flush_interval` seconds. The file is opened on
+    the caller's thread, and close() drains the queue, waits for the thread
+    and re-raises any error the writer hit.
+    """
+
+    def __init__(self, path, batch_size=64, flush_interval=1.0):
+        super().__init__(daemon=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.q = queue.Queue()
+        self.error = None
+        self._log_f = open(path, "ab")
+        self.start()
+
+    def write(self, record):
+        self.q.put(record)
+
+    def close(self):
+        self.q.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        pending = []
+        last_flush = time.monotonic()
+        done = False
+        try:
+            while not done:
+                try:
+                    record = self.q.get(timeout=self.flush_interval)
+                    if record is None:
+                        done = True
+                    else:
+                        pending.append(record)
+                except queue.Empty:
+                    pass
+
+                now = time.monotonic()
+                due = done or now - last_flush >= self.flush_interval
+                if pending and (due or len(pending) >= self.batch_size):
+                    self._log_f.write(b"".join(pending))
+                    pending.clear()
+                if due:
+                    self._log_f.flush()
+                    last_flush = now
+        except Exception as e:
+            self.error = e
+        finally:
+            self._log_f.close()
+
+
+def collect_response_from_gpt(db_path_list, question_list, api_key, engine, knowledge_list=None,
+                              log_dir="./exp_result/log/", concurrency=8, rpm=500,
+                              use_cache=True, cache_dir=DEFAULT_CACHE_DIR):
+    """Query GPT for every question concurrently, keeping responses in question order.
+
+    At most `concurrency` requests are in flight at once and no more than `rpm`
+    requests are started per minute. With `use_cache`, identical prompts are
+    sent once and their responses are reused from an on-disk cache across runs.
+    """
+    api_key = resolve_api_key(api_key)
     os.makedirs(log_dir, exist_ok=True)
-    log_path = os.path.join(log_dir, "prompt_log.txt")
-
-    responses = []
-    with open(log_path, "a", encoding="utf-8") as log_f:
-        for i, question in tqdm(enumerate(question_list), total=len(question_list)):
-            db_id = os.path.basename(db_path_list[i]).replace('.sqlite', '')
-            print(f"--------------------- processing {i}th question ({db_id}) ---------------------")
-            print(f"Question: {question}")
+    log_path = os.path.join(log_dir, "prompt_log.jsonl")
 
-            if knowledge_list:
-                prompt = generate_combined_prompts_one(db_path=db_path_list[i], question=question, knowledge=knowledge_list[i])
-            else:
-                prompt = generate_combined_prompts_one(db_path=db_path_list[i], question=question)
+    responses = [None] * len(question_list)
+    warm_schema_cache(db_path_list)
+    cache = diskcache.Cache(cache_dir) if use_cache else None
+    # prompt hash -> future of the first request for it, so concurrent duplicates wait on one call
+    inflight: Dict[str, asyncio.Future] = {}
 
+    async def _request(client, semaphore, limiter, prompt, key):
+        async with semaphore:
             try:
-                sql_text = connect_gpt(client, engine=engine, prompt=prompt)
+                sql_text = await connect_gpt_async(client, engine=engine, prompt=prompt, limiter=limiter)
             except Exception as e:
-                sql_text = f"error:{e}"
+                return f"error:{e}"
+        if cache is not None:
+            cache[key] = sql_text
+        return sql_text
+
+    async def _one(i, client, semaphore, limiter):
+        question = question_list[i]
+        db_id = os.path.basename(db_path_list[i]).replace('.sqlite', '')
+
+        if knowledge_list:
+            prompt = generate_combined_prompts_one(db_path=db_path_list[i], question=question, knowledge=knowledge_list[i])
+        else:
+            prompt = generate_combined_prompts_one(db_path=db_path_list[i], question=question)
+
+        if cache is None:
+            sql_text = await _request(client, semaphore, limiter, prompt, None)
+        else:
+            key = prompt_hash("completions", engine, prompt)
+            sql_text = cache.get(key)
+            if sql_text is None:
+                if key not in inflight:
+                    inflight[key] = asyncio.ensure_future(_request(client, semaphore, limiter, prompt, key))
+                sql_text = await inflight[key]
+
+        responses[i] = format_response(sql_text, db_id)
+        log_writer.write(format_log_entry(i, db_id, question, engine, prompt, sql_text))
+
+    async def _main():
+        semaphore = asyncio.Semaphore(concurrency)
+        limiter = AsyncLimiter(rpm, 60)
+        async with AsyncOpenAI(api_key=api_key) as client:
+            tasks = [_one(i, client, semaphore, limiter) for i in range(len(question_list))]
+            # per-question details go to the prompt log only; keep terminal writes sparse
+            for task in async_tqdm.as_completed(tasks, total=len(tasks), miniters=50, mininterval=1.0):
+                await task
+
+    log_writer = _LogWriter(log_path)
+    try:
+        asyncio.run(_main())
+    finally:
+        log_writer.close()
+        if cache is not None:
+            cache.close()
+
+    print(f"Prompt log saved to: {log_path}")
+    return responses
+
+
+
+def build_batch_request(i, engine, prompt, max_tokens=256, temperature=0, stop=None):
+    """One JSONL line of a /v1/chat/completions Batch job."""
+    return {
+        "custom_id": f"q{i}",
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": engine,
+            "messages": [
+                {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stop": stop or [";", "#", "--"]
+        }
+    }
+
+
+def parse_batch_output(text):
+    """Map custom_id -> completion text (or error string) from a Batch output file."""
+    outputs: Dict[str, str] = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        if response.get("status_code") == 200:
+            content = response["body"]["choices"][0]["message"]["content"] or ""
+            outputs[record["custom_id"]] = _FENCE_RE.sub("", content).strip()
+        else:
+            outputs[record["custom_id"]] = f"error:{record.get('error') or response.get('body')}"
+    return outputs
+
+
+def run_batch_job(client, requests, batch_input_path, poll_interval=30):
+    """Upload `requests` as a /v1/chat/completions Batch job and return its parsed outputs."""
+    with open(batch_input_path, "w", encoding="utf-8") as f:
+        for request in requests:
+            f.write(json.dumps(request) + "\n")
+
+    with open(batch_input_path, "rb") as f:
+        batch_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    print(f"Submitted batch {batch.id} with {len(requests)} requests")
+
+    while batch.status not in BATCH_FINAL_STATUSES:
+        time.sleep(poll_interval)
+        batch = client.batches.retrieve(batch.id)
+        print(f"Batch {batch.id}: {batch.status}")
+
+    if batch.status != "completed":
+        raise RuntimeError(f"❌ Batch {batch.id} finished with status '{batch.status}'")
+
+    # Requests the Batch API rejects are reported in the error file, not the output file.
+    outputs: Dict[str, str] = {}
+    for file_id in (batch.error_file_id, batch.output_file_id):
+        if file_id:
+            outputs.update(parse_batch_output(client.files.content(file_id).text))
+    return outputs
+
+
+def collect_response_from_gpt_batch(db_path_list, question_list, api_key, engine, knowledge_list=None,
+                                    log_dir="./exp_result/log/", poll_interval=30,
+                                    use_cache=True, cache_dir=DEFAULT_CACHE_DIR):
+    """Submit every question as a single Batch API job and wait for it to finish.
+
+    Intended for offline evaluation runs: results can take up to 24h but are
+    billed at the discounted batch rate and are not bound by the RPM limit.
+    With `use_cache`, only distinct prompts missing from the on-disk cache are
+    submitted.
+    """
+    client = init_client(api_key)
+    os.makedirs(log_dir, exist_ok=True)
+    log_path = os.path.join(log_dir, "prompt_log.jsonl")
+    batch_input_path = os.path.join(log_dir, "batch_input.jsonl")
+
+    warm_schema_cache(db_path_list)
+    prompts = []
+    for i, question in enumerate(question_list):
+        if knowledge_list:
+            prompts.append(generate_combined_prompts_one(db_path=db_path_list[i], question=question, knowledge=knowledge_list[i]))
+        else:
+            prompts.append(generate_combined_prompts_one(db_path=db_path_list[i], question=question))
+
+    cache = diskcache.Cache(cache_dir) if use_cache else None
+    if cache is not None:
+        keys = [prompt_hash("chat", engine, prompt) for prompt in prompts]
+    else:
+        keys = [f"q{i}" for i in range(len(prompts))]
 
-            sql = 'SELECT' + sql_text if not sql_text.strip().upper().startswith('SELECT') else sql_text
-            sql = sql.strip() + f"\t----- bird -----\t{db_id}"
-            responses.append(sql)
+    results: Dict[str, str] = {}
+    pending: Dict[str, int] = {}  # key -> index of the first question with that prompt
+    try:
+        for i, key in enumerate(keys):
+            if key in results or key in pending:
+                continue
+            cached = cache.get(key) if cache is not None else None
+            if cached is not None:
+                results[key] = cached
+            else:
+                pending[key] = i
+
+        if pending:
+            requests = [build_batch_request(i, engine, prompts[i]) for i in pending.values()]
+            outputs = run_batch_job(client, requests, batch_input_path, poll_interval=poll_interval)
+            for key, i in pending.items():
+                sql_text = outputs.get(f"q{i}", "error:missing from batch output")
+                results[key] = sql_text
+                if cache is not None and not sql_text.startswith("error:"):
+                    cache[key] = sql_text
+    finally:
+        if cache is not None:
+            cache.close()
 
-            log_f.write("============================================================\n")
-            log_f.write(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]  Q#{i}  DB: {db_id}\n")
-            log_f.write(f"Question: {question}\n")
-            log_f.write(f"\n----- Prompt Sent to {engine} -----\n{prompt}\n")
-            log_f.write(f"\n----- LLM Response -----\n{sql_text.strip()}\n")
-            log_f.write("============================================================\n\n")
-            log_f.flush()  # 매 쿼리마다 바로 기록됨
+    responses = []
+    log_writer = _LogWriter(log_path)
+    try:
+        for i, question in enumerate(question_list):
+            db_id = os.path.basename(db_path_list[i]).replace('.sqlite', '')
+            sql_text = results[keys[i]]
+            responses.append(format_response(sql_text, db_id))
+            log_writer.write(format_log_entry(i, db_id, question, engine, prompts[i], sql_text))
+    finally:
+        log_writer.close()
 
     print(f"Prompt log saved to: {log_path}")
     return responses
 
 
 
+def stream_eval(path):
+    """Lazily yield the records of a JSON array file (e.g. BIRD dev.json)."""
+    with open(path, 'rb') as f:
+        yield from ijson.items(f, 'item')
+
+
 def decouple_question_schema(datasets, db_root_path):
+    """Split an iterable of eval records into question, db_path and knowledge lists."""
     question_list, db_path_list, knowledge_list = [], [], []
     for data in datasets:
         question_list.append(data['question'])
@@ -302,7 +686,12 @@ def generate_sql_file(sql_lst, output_path=None):
     result = {i: sql for i, sql in enumerate(sql_lst)}
     if output_path:
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        json.dump(result, open(output_path, 'w'), indent=4)
+        if orjson is not None:
+            with open(output_path, 'wb') as f:
+                f.write(orjson.dumps(result, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        else:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2, ensure_ascii=False)
     return result
 
 
@@ -318,20 +707,32 @@ if __name__ == '__main__':
     parser.add_argument('--data_output_path', type=str, default='./exp_result/')
     parser.add_argument('--chain_of_thought', type=str, default='False')
     parser.add_argument('--log_dir', type=str, default='./exp_result/log/')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rpm', type=int, default=500)
+    parser.add_argument('--api_mode', type=str, default='async', choices=['async', 'batch'])
+    parser.add_argument('--no_cache', type=str, default='False')
+    parser.add_argument('--cache_dir', type=str, default=DEFAULT_CACHE_DIR)
     args = parser.parse_args()
 
-    eval_data = json.load(open(args.eval_path))
-    question_list, db_path_list, knowledge_list = decouple_question_schema(eval_data, args.db_root_path)
+    question_list, db_path_list, knowledge_list = decouple_question_schema(
+        stream_eval(args.eval_path), args.db_root_path
+    )
+
+    if args.use_knowledge != 'True':
+        knowledge_list = None
 
-    if args.use_knowledge == 'True':
-        responses = collect_response_from_gpt(
+    if args.api_mode == 'batch':
+        responses = collect_response_from_gpt_batch(
             db_path_list, question_list, args.api_key, args.engine,
-            knowledge_list, log_dir=args.log_dir
+            knowledge_list=knowledge_list, log_dir=args.log_dir,
+            use_cache=args.no_cache != 'True', cache_dir=args.cache_dir
         )
     else:
         responses = collect_response_from_gpt(
             db_path_list, question_list, args.api_key, args.engine,
-            knowledge_list=None, log_dir=args.log_dir
+            knowledge_list=knowledge_list, log_dir=args.log_dir,
+            concurrency=args.concurrency, rpm=args.rpm,
+            use_cache=args.no_cache != 'True', cache_dir=args.cache_dir
         )
 
     if args.chain_of_thought == 'True':
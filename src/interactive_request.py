@@ -1,35 +1,51 @@
 #!/usr/bin/env python3
-import os, json, argparse, sqlite3
+import os, json, argparse, sqlite3, time
 from datetime import datetime
-from openai import OpenAI
-from gpt_request import generate_schema_prompt, generate_comment_prompt
+from gpt_request import generate_schema_prompt, generate_comment_prompt, init_client, _FENCE_RE
 from tqdm import tqdm
-import re
 
 
+# Same per-query budget as the evaluator (run_evaluation.sh: meta_time_out=30.0).
+PROGRESS_INTERVAL = 10000
+META_TIME_OUT = 30.0
 
-def execute_and_compare(predicted_sql, gold_sql, db_path):
+
+def fetch_result_set(conn, sql, timeout=None):
+    """
+    SQL을 실행하고 결과 row들을 바로 set으로 모음 (fetchall 리스트 생략).
+    timeout(초)이 주어지면 wall-clock 기준으로 그 시간이 지나면 실행을 중단함.
+    """
+    if timeout:
+        deadline = time.monotonic() + timeout
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_INTERVAL)
+    try:
+        return set(conn.execute(sql))
+    except sqlite3.OperationalError:
+        if timeout and time.monotonic() > deadline:
+            raise TimeoutError(f"timed out after {timeout}s")
+        raise
+    finally:
+        if timeout:
+            conn.set_progress_handler(None, 0)
+
+
+def execute_and_compare(predicted_sql, gold_sql, conn, timeout=META_TIME_OUT):
     """
     두 SQL을 실제 DB에 실행시켜 결과를 비교함.
+    conn은 호출하는 쪽(interactive_loop)에서 열고 닫음.
+    두 SQL 모두 evaluator와 같은 timeout을 적용함.
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
     try:
-        cursor.execute(predicted_sql)
-        pred_res = cursor.fetchall()
+        pred_set = fetch_result_set(conn, predicted_sql, timeout=timeout)
     except Exception as e:
-        conn.close()
         return False, f"Predicted SQL Execution Error: {e}"
 
     try:
-        cursor.execute(gold_sql)
-        gold_res = cursor.fetchall()
+        gold_set = fetch_result_set(conn, gold_sql, timeout=timeout)
     except Exception as e:
-        conn.close()
         return False, f"Gold SQL Execution Error: {e}"
 
-    conn.close()
-    if set(pred_res) == set(gold_res):
+    if pred_set == gold_set:
         return True, "Execution results match "
     else:
         return False, "Execution results differ "
@@ -38,13 +54,22 @@ def execute_and_compare(predicted_sql, gold_sql, db_path):
 # ============================================================
 # Feedback 자동 생성
 # ============================================================
-def auto_feedback(pred_sql, gold_sql):
-    """단순 rule-based feedback"""
-    if "where" not in pred_sql.lower() and "where" in gold_sql.lower():
+FEEDBACK_KEYWORDS = ("where", "group by", "join")
+
+
+def gold_keyword_flags(gold_sql):
+    """gold SQL에 각 keyword가 있는지 한 번만 계산"""
+    gold_lower = gold_sql.lower()
+    return {k: k in gold_lower for k in FEEDBACK_KEYWORDS}
+
+
+def auto_feedback(pred_lower, gold_flags):
+    """단순 rule-based feedback (pred_lower: 소문자 pred SQL, gold_flags: gold_keyword_flags 결과)"""
+    if gold_flags["where"] and "where" not in pred_lower:
         return "You forgot the WHERE condition."
-    elif "group by" in gold_sql.lower() and "group by" not in pred_sql.lower():
+    elif gold_flags["group by"] and "group by" not in pred_lower:
         return "You missed the GROUP BY clause."
-    elif "join" in gold_sql.lower() and "join" not in pred_sql.lower():
+    elif gold_flags["join"] and "join" not in pred_lower:
         return "You should include a JOIN operation."
     else:
         return "The SQL result is incorrect. Please refine conditions or joins."
@@ -88,49 +113,56 @@ def interactive_loop(client, question, db_path, gold_sql, max_iter=3, model="gpt
                      log_path="./exp_result/log/interactive_log.txt"):
     os.makedirs(os.path.dirname(log_path), exist_ok=True)
     schema_prompt = generate_schema_prompt(db_path)
+    gold_flags = gold_keyword_flags(gold_sql)
     feedback_history = []
     pred_sql = ""
     log_f = open(log_path, "a", encoding="utf-8")
+    # 매 step마다 connect/close 하지 않도록 한 번만 열어서 재사용 (읽기 전용)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA query_only=1")
 
-    for step in range(max_iter):
-        # 프롬프트 생성
-        prompt = build_interactive_prompt(schema_prompt, question, feedback_history, pred_sql if step else "")
-
-        # LLM 호출
-        pred_sql = call_llm(client, prompt, model=model)
-        pred_sql = re.sub(r"```sql|```", "", pred_sql, flags=re.IGNORECASE).strip()
-
-        # 실행 및 결과 비교
-        same, message = execute_and_compare(pred_sql, gold_sql, db_path)
-        print(f"\n[Step {step+1}] Predicted SQL:\n{pred_sql}")
-        print(f"→ Execution Check: {message}")
-
-        # 로그 작성
-        log_f.write("============================================================\n")
-        log_f.write(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Step {step+1}\n")
-        log_f.write(f"Question: {question}\n")
-        log_f.write(f"Prompt:\n{prompt}\n")
-        log_f.write(f"Predicted SQL:\n{pred_sql}\n")
-        log_f.write(f"Execution Result: {message}\n")
-
-        if same:
-            print("Correct SQL found (Execution results match)!\n")
-            log_f.write("Result: Correct SQL (execution match)\n")
-            break
-
-        # 사용자 피드백 입력
-        feedback_mode = input("Provide manual feedback? (y/n): ").strip().lower()
-        if feedback_mode == "y":
-            feedback = input("Enter feedback: ").strip()
-        else:
-            feedback = auto_feedback(pred_sql, gold_sql)
-            print("Auto Feedback:", feedback)
-
-        feedback_history.append(feedback)
-        log_f.write(f"Feedback added: {feedback}\n")
-
-    log_f.write("============================================================\n\n")
-    log_f.close()
+    try:
+        for step in range(max_iter):
+            # 프롬프트 생성
+            prompt = build_interactive_prompt(schema_prompt, question, feedback_history, pred_sql if step else "")
+
+            # LLM 호출
+            pred_sql = call_llm(client, prompt, model=model)
+            pred_sql = _FENCE_RE.sub("", pred_sql).strip()
+
+            # 실행 및 결과 비교
+            same, message = execute_and_compare(pred_sql, gold_sql, conn)
+            print(f"\n[Step {step+1}] Predicted SQL:\n{pred_sql}")
+            print(f"→ Execution Check: {message}")
+
+            # 로그 작성
+            log_f.write("============================================================\n")
+            log_f.write(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Step {step+1}\n")
+            log_f.write(f"Question: {question}\n")
+            log_f.write(f"Prompt:\n{prompt}\n")
+            log_f.write(f"Predicted SQL:\n{pred_sql}\n")
+            log_f.write(f"Execution Result: {message}\n")
+
+            if same:
+                print("Correct SQL found (Execution results match)!\n")
+                log_f.write("Result: Correct SQL (execution match)\n")
+                break
+
+            # 사용자 피드백 입력
+            feedback_mode = input("Provide manual feedback? (y/n): ").strip().lower()
+            if feedback_mode == "y":
+                feedback = input("Enter feedback: ").strip()
+            else:
+                feedback = auto_feedback(pred_sql.lower(), gold_flags)
+                print("Auto Feedback:", feedback)
+
+            feedback_history.append(feedback)
+            log_f.write(f"Feedback added: {feedback}\n")
+
+        log_f.write("============================================================\n\n")
+    finally:
+        log_f.close()
+        conn.close()
     return {
         "question": question,
         "pred_sql": pred_sql,
@@ -153,7 +185,7 @@ if __name__ == "__main__":
     # 데이터 로드
     data = json.load(open(args.eval_path))
     gold_lines = [line.strip().split("\t")[0] for line in open(args.gold_path, "r")]
-    client = OpenAI(api_key=args.api_key)
+    client = init_client(args.api_key)
 
     # 사용자 입력
     idx = int(input(f"Enter question index (0 ~ {len(data)-1}): "))